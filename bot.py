@@ -1,14 +1,22 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
+import imageio_ffmpeg
 import asyncio
 import os
 import tempfile
-from datetime import datetime
+import time
+import itertools
+from pathlib import Path
 import logging
+import multiprocessing
+import sqlite3
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # Import your video generator (assuming it's saved as video_generator.py)
 try:
-    from video_generator import create_welcome_video
+    from video_generator import create_welcome_video_async, prune_video_cache, warm_up, VIDEO_WIDTH, VIDEO_HEIGHT
 except ImportError:
     print("Error: Make sure video_generator.py is in the same directory!")
     exit(1)
@@ -29,8 +37,148 @@ bot = commands.Bot(
 )
 
 # Welcome settings
-welcome_channels = {}  # {guild_id: channel_id}
+welcome_channels = {}  # {guild_id: channel_id}, write-through cache of the welcome_channels table
+DB_PATH = os.getenv("TCORPION_DB", "tcorpion.db")
+db = None  # Opened in setup_hook
+
+# Scratch directory for videos waiting to be uploaded, each file is deleted right after sending
+WELCOME_TMP = Path(tempfile.gettempdir()) / "tcorpion"
+_filename_counter = itertools.count()  # Unique per run, files don't outlive the upload
 background_image = "bg.png"  # Your background image
+background_cache = "bg_cache.png"  # background_image pre-scaled to the video size
+background_state = (None, None)  # (path, mtime) of the background to render with, see refresh_background
+
+# Worker pool sizes (override with environment variables)
+VIDEO_WORKERS = int(os.getenv("TCORPION_VIDEO_WORKERS", max(2, (os.cpu_count() or 2) // 2)))
+THREAD_WORKERS = int(os.getenv("TCORPION_THREAD_WORKERS", "4"))
+
+# Frame rendering is CPU-bound, run it in worker processes so joins render in parallel.
+# Created in setup_hook, see make_video_executor.
+VIDEO_EXECUTOR = None
+
+# Join bursts: cap videos rendering at once, and how many may wait before we fall back to text
+MAX_CONCURRENT_VIDEOS = int(os.getenv("TCORPION_MAX_CONCURRENT_VIDEOS", "2"))
+MAX_PENDING_VIDEOS = int(os.getenv("TCORPION_MAX_PENDING_VIDEOS", "8"))
+VIDEO_SEM = asyncio.Semaphore(MAX_CONCURRENT_VIDEOS)
+pending_videos = 0  # Videos waiting for or holding VIDEO_SEM
+
+# Joins are collected per guild for JOIN_WINDOW seconds; bigger bursts get one shared video
+JOIN_WINDOW = 2
+GROUP_WELCOME_THRESHOLD = 3
+MENTIONS_PER_MESSAGE = 50  # Keeps group welcome messages under Discord's 2000 character limit
+join_buffer = defaultdict(list)  # {guild_id: [member, ...]}
+join_flush_tasks = {}  # {guild_id: asyncio.Task}
+
+def make_video_executor():
+    """Process pool for frame rendering
+    
+    Not forked from the bot: such workers would inherit ffmpeg's stdin pipes and keep them open.
+    forkserver workers fork from a server that already imported the rendering stack; where it
+    isn't available (Windows), spawned workers import it themselves. Either way workers
+    re-execute the launching script, which is why the bot is started through run.py.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        mp_context = multiprocessing.get_context("forkserver")
+        mp_context.set_forkserver_preload([
+            "numpy", "PIL.Image", "PIL.ImageDraw", "PIL.ImageFilter", "PIL.ImageFont", "imageio", "video_generator"
+        ])
+    else:
+        mp_context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=VIDEO_WORKERS, mp_context=mp_context, initializer=warm_up)
+
+def replace_broken_executor(broken):
+    """Swap in a fresh video pool after a worker died (OOM kill, crash)
+    
+    A ProcessPoolExecutor stays broken for good once a worker exits unexpectedly. Welcomes that
+    failed on the same pool all call this, only the first one replaces it.
+    """
+    global VIDEO_EXECUTOR
+    if VIDEO_EXECUTOR is not broken:
+        return
+    logger.warning("Video worker process died, restarting the video pool")
+    VIDEO_EXECUTOR = make_video_executor()
+    broken.shutdown(wait=False, cancel_futures=True)
+
+@bot.event
+async def setup_hook():
+    """Called once before connecting - create the worker pools for the bot's blocking calls"""
+    global VIDEO_EXECUTOR
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=THREAD_WORKERS, thread_name_prefix="tcor")
+    )
+    VIDEO_EXECUTOR = make_video_executor()
+    logger.info(f"Executors: {VIDEO_WORKERS} video processes, {THREAD_WORKERS} threads")
+    
+    # Restore welcome channels saved before the last restart
+    global db
+    db = sqlite3.connect(DB_PATH)
+    db.execute("CREATE TABLE IF NOT EXISTS welcome_channels(guild INTEGER PRIMARY KEY, channel INTEGER)")
+    welcome_channels.update(db.execute("SELECT guild, channel FROM welcome_channels"))
+    logger.info(f"Loaded {len(welcome_channels)} welcome channel(s) from {DB_PATH}")
+    
+    # Keep the welcome video cache bounded across restarts
+    await asyncio.to_thread(prune_video_cache)
+    await asyncio.to_thread(sweep_welcome_tmp)
+
+def sweep_welcome_tmp(max_age=3600):
+    """Create WELCOME_TMP and remove videos left behind by a crashed run"""
+    WELCOME_TMP.mkdir(exist_ok=True)
+    cutoff = time.time() - max_age
+    for path in WELCOME_TMP.iterdir():
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            pass
+
+async def resize_background(source_mtime_ns):
+    """Scale and crop background_image to the video size once, so workers never decode a huge image
+    
+    The cache gets the source's mtime, so any change to bg.png (even to an older file) is noticed.
+    """
+    # Unique per call, on_ready and watch_background may both rebuild right after bg.png changes
+    fd, partial = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(background_cache)), suffix=".png")
+    os.close(fd)
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-loglevel", "error",
+            "-i", background_image,
+            "-vf", f"scale={VIDEO_WIDTH}:{VIDEO_HEIGHT}:force_original_aspect_ratio=increase,crop={VIDEO_WIDTH}:{VIDEO_HEIGHT}",
+            "-frames:v", "1", partial,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await proc.communicate()
+        if proc.returncode != 0:
+            raise RuntimeError(stderr.decode(errors="replace").strip())
+        os.utime(partial, ns=(source_mtime_ns, source_mtime_ns))
+        os.replace(partial, background_cache)  # Atomic, workers never see a half-written file
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+async def refresh_background():
+    """Stat the background image once, welcomes reuse the result instead of checking per join"""
+    global background_state
+    try:
+        source_stat = os.stat(background_image)
+    except OSError:
+        background_state = (None, None)
+        return
+    
+    try:
+        # The cache carries the mtime of the source it was built from, see resize_background
+        if not os.path.exists(background_cache) or os.stat(background_cache).st_mtime_ns != source_stat.st_mtime_ns:
+            await resize_background(source_stat.st_mtime_ns)
+            logger.info(f"Pre-scaled {background_image} to {background_cache}")
+        background_state = (background_cache, os.stat(background_cache).st_mtime)
+    except Exception as e:
+        logger.error(f"Could not pre-scale {background_image}, using it as is: {e}")
+        background_state = (background_image, source_stat.st_mtime)
+
+@tasks.loop(minutes=1)
+async def watch_background():
+    """Pick up a replaced or removed background image"""
+    await refresh_background()
 
 @bot.event
 async def on_ready():
@@ -40,6 +188,10 @@ async def on_ready():
     logger.info(f'Loaded commands: {[cmd.name for cmd in bot.commands]}')
     logger.info('------')
     
+    await refresh_background()
+    if not watch_background.is_running():
+        watch_background.start()
+    
     # Set bot status
     await bot.change_presence(
         activity=discord.Activity(
@@ -95,31 +247,105 @@ async def on_member_join(member):
         logger.error(f"No permission to attach files in {channel.name}")
         return
     
-    await send_welcome_video(channel, member)
+    join_buffer[guild.id].append(member)
+    if guild.id not in join_flush_tasks:
+        join_flush_tasks[guild.id] = asyncio.create_task(flush_joins(guild.id, channel))
+
+async def flush_joins(guild_id, channel):
+    """Welcome everyone who joined during the window, individually or with one group video"""
+    await asyncio.sleep(JOIN_WINDOW)
+    # Take the batch before sending, joins from here on start a new window
+    members = join_buffer.pop(guild_id, [])
+    join_flush_tasks.pop(guild_id, None)
+    
+    if len(members) > GROUP_WELCOME_THRESHOLD:
+        logger.info(f"{len(members)} joins in {JOIN_WINDOW}s in {channel.guild.name}, sending group welcome")
+        await send_group_welcome(channel, members)
+    else:
+        await asyncio.gather(*(send_welcome_video(channel, member) for member in members))
+
+async def send_group_welcome(channel, members):
+    """Send one shared welcome video that mentions every member of a join burst"""
+    mentions = [member.mention for member in members]
+    video_path = WELCOME_TMP / f"welcome_group_{channel.guild.id}_{next(_filename_counter)}.mp4"
+    executor = None
+    
+    try:
+        async with channel.typing():
+            async with VIDEO_SEM:
+                executor = VIDEO_EXECUTOR  # Read after waiting, the pool may have been replaced meanwhile
+                WELCOME_TMP.mkdir(parents=True, exist_ok=True)  # /tmp cleaners may have removed it since setup_hook
+                bg_path, bg_mtime = background_state
+                await create_welcome_video_async(
+                    username="everyone",
+                    output_file=str(video_path),
+                    bg_image=bg_path,
+                    verbose=False,
+                    executor=executor,
+                    bg_mtime=bg_mtime
+                )
+            discord_file = discord.File(video_path, filename="welcome_everyone.mp4")
+            await channel.send(f"🎉 Welcome {' '.join(mentions[:MENTIONS_PER_MESSAGE])}!", file=discord_file)
+        first_text = MENTIONS_PER_MESSAGE
+    except Exception as e:
+        logger.error(f"Error creating group welcome video: {e}")
+        if isinstance(e, BrokenProcessPool):
+            replace_broken_executor(executor)
+        first_text = 0
+    finally:
+        video_path.unlink(missing_ok=True)
+    
+    # Remaining mentions (or all of them if the video failed) as plain text
+    for start in range(first_text, len(mentions), MENTIONS_PER_MESSAGE):
+        try:
+            await channel.send(f"🎉 Welcome {' '.join(mentions[start:start + MENTIONS_PER_MESSAGE])} to **{channel.guild.name}**!")
+        except Exception as e:
+            logger.error(f"Group welcome message failed: {e}")
 
 async def send_welcome_video(channel, member):
+    """Generate and send welcome video, or a text welcome when too many are queued"""
+    global pending_videos
+    
+    if pending_videos >= MAX_PENDING_VIDEOS:
+        logger.warning(f"{pending_videos} welcome videos pending, sending text welcome for {member.display_name}")
+        try:
+            await channel.send(f"🎉 Welcome {member.mention} to **{channel.guild.name}**!")
+        except Exception as e:
+            logger.error(f"Text welcome failed: {e}")
+        return
+    
+    pending_videos += 1
+    try:
+        async with VIDEO_SEM:
+            await _send_welcome_video(channel, member)
+    finally:
+        pending_videos -= 1
+
+async def _send_welcome_video(channel, member):
     """Generate and send welcome video"""
+    executor = VIDEO_EXECUTOR
     try:
         # Show typing indicator
         async with channel.typing():
             logger.info(f"Creating welcome video for {member.display_name}")
             
             # Create unique filename to avoid conflicts
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            video_filename = f"welcome_{member.id}_{timestamp}.mp4"
+            video_filename = f"welcome_{member.id}_{next(_filename_counter)}.mp4"
             
-            # Generate video in a temporary directory
-            with tempfile.TemporaryDirectory() as temp_dir:
-                video_path = os.path.join(temp_dir, video_filename)
+            # Generate video in the shared scratch directory
+            video_path = WELCOME_TMP / video_filename
+            try:
+                WELCOME_TMP.mkdir(parents=True, exist_ok=True)  # /tmp cleaners may have removed it since setup_hook
                 
-                # Create the welcome video
-                await asyncio.to_thread(
-                    create_welcome_video,
+                # Create the welcome video - frames render in the video pool, ffmpeg runs as an async subprocess
+                bg_path, bg_mtime = background_state
+                await create_welcome_video_async(
                     username=member.display_name,
-                    output_file=video_path,
-                    bg_image=background_image if os.path.exists(background_image) else None,
-                    cleanup=True,
-                    verbose=False
+                    output_file=str(video_path),
+                    bg_image=bg_path,
+                    verbose=False,
+                    executor=executor,
+                    bg_mtime=bg_mtime
                 )
                 
                 # Send the video
@@ -147,19 +373,22 @@ async def send_welcome_video(channel, member):
                     embed.set_thumbnail(url=member.display_avatar.url)
                     embed.set_footer(text=f"Member #{channel.guild.member_count}")
                     
-                    # Send video and embed
-                    with open(video_path, 'rb') as video_file:
-                        discord_file = discord.File(video_file, filename=f"welcome_{member.display_name}.mp4")
-                        await channel.send(file=discord_file, embed=embed)
+                    # Send video and embed - discord.py opens the path itself and streams it
+                    discord_file = discord.File(video_path, filename=f"welcome_{member.display_name}.mp4")
+                    await channel.send(file=discord_file, embed=embed)
                     
                     logger.info(f"Welcome video sent for {member.display_name}")
                 else:
                     # Fallback if video creation fails
                     await channel.send(f"🎉 Welcome {member.mention} to **{channel.guild.name}**!")
                     logger.error("Video file not found after creation")
+            finally:
+                video_path.unlink(missing_ok=True)
     
     except Exception as e:
         logger.error(f"Error creating welcome video for {member.display_name}: {e}")
+        if isinstance(e, BrokenProcessPool):
+            replace_broken_executor(executor)
         # Send simple welcome message as fallback
         try:
             await channel.send(f"🎉 Welcome {member.mention} to **{channel.guild.name}**!")
@@ -188,6 +417,8 @@ async def set_welcome_channel(ctx, channel: discord.TextChannel = None):
         return
     
     welcome_channels[ctx.guild.id] = channel.id
+    db.execute("INSERT OR REPLACE INTO welcome_channels VALUES(?, ?)", (ctx.guild.id, channel.id))
+    db.commit()
     
     embed = discord.Embed(
         title="✅ Welcome Channel Set!",
@@ -300,7 +531,8 @@ async def on_command_error(ctx, error):
         logger.error(f"Unhandled command error: {error}")
         await ctx.send(f"❌ Something went wrong: {error}")
 
-if __name__ == "__main__":
+def main():
+    """Check the configuration and run the bot until it is closed"""
     # Configuration
     TOKEN = ""
     
@@ -320,7 +552,7 @@ if __name__ == "__main__":
     
     # Check video generator
     try:
-        from video_generator import create_welcome_video
+        from video_generator import create_welcome_video_async
         print("✅ Video generator imported successfully")
     except ImportError as e:
         print(f"❌ Could not import video generator: {e}")
@@ -334,4 +566,13 @@ if __name__ == "__main__":
     except discord.LoginFailure:
         print("❌ Invalid bot token!")
     except Exception as e:
-        print(f"❌ Failed to start bot: {e}")
\ No newline at end of file
+        print(f"❌ Failed to start bot: {e}")
+    finally:
+        if VIDEO_EXECUTOR is not None:
+            VIDEO_EXECUTOR.shutdown(cancel_futures=True)
+        if db is not None:
+            db.close()
+
+if __name__ == "__main__":
+    # Prefer `python run.py`: video workers re-execute the launching script, and bot.py imports discord.py
+    main()
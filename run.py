@@ -0,0 +1,9 @@
+"""Start the welcome bot: python run.py
+
+Video worker processes re-execute the script that launched the bot, so this
+launcher stays free of discord.py and only imports the bot when run directly.
+"""
+
+if __name__ == "__main__":
+    import bot
+    bot.main()
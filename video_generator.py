@@ -1,219 +1,357 @@
 import os
-import io
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageDraw, ImageFilter, ImageFont, ImageOps
 import imageio
-import cairosvg
-import base64
-import random
+import imageio_ffmpeg
+import functools
+import asyncio
+import hashlib
+import shutil
+import tempfile
+import zlib
+from pathlib import Path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 # Video dimensions - more banner-like (16:9 but can adjust)
 VIDEO_WIDTH = 1920
 VIDEO_HEIGHT = 1080
 FONT_SIZE = 72  # Larger for banner effect
+DECORATION_FONT_SIZE = 48
+GLOW_RADIUS = 3
 
-def image_to_base64(image_path):
-    """Convert image to base64 for embedding in SVG"""
-    try:
-        with open(image_path, 'rb') as img_file:
-            img_data = img_file.read()
-            img_base64 = base64.b64encode(img_data).decode('utf-8')
-            # Detect image format
-            if image_path.lower().endswith('.png'):
-                return f"data:image/png;base64,{img_base64}"
-            elif image_path.lower().endswith(('.jpg', '.jpeg')):
-                return f"data:image/jpeg;base64,{img_base64}"
-            else:
-                return f"data:image/png;base64,{img_base64}"
-    except Exception:
-        return None
+# Banner layout - shared by the background and text layers
+BANNER_HEIGHT = 140  # Reduced height for sleeker look
+BANNER_Y = (VIDEO_HEIGHT - BANNER_HEIGHT) // 2
+LEFT_MARGIN = 150  # More space from left edge
+TEXT_Y = VIDEO_HEIGHT // 2  # Center vertically
+BANNER_ROWS = slice(BANNER_Y, BANNER_Y + BANNER_HEIGHT)  # The only rows that change between frames
+
+# Monospace fonts to try in order (Windows names first, then common Linux/macOS ones)
+FONT_CANDIDATES = [
+    "courbd.ttf", "cour.ttf", "Courier New Bold.ttf", "Courier New.ttf",
+    "DejaVuSansMono-Bold.ttf", "LiberationMono-Bold.ttf",
+]
+
+# Below this many characters a process pool costs more than it saves
+PARALLEL_MIN_CHARS = 4
+# Frames rendering ahead of the ffmpeg pipe in the async pipeline
+MAX_FRAMES_IN_FLIGHT = 4
 
-def typing_svg_frame(text, chars_visible, text_color="#00FF41", bg_image=None, overlay_opacity=0.7):
-    """Generate SVG frame for terminal-banner typing animation"""
+WELCOME_COLORS = ["#00FF41", "#009DFF", "#FF004C", "#FFFFFF", "#FFA200"]
+WELCOME_FPS = 6
+WELCOME_HOLD_END = 30
+
+# Finished welcome videos, reused for repeat tests and rejoins
+CACHE_DIR = Path(tempfile.gettempdir()) / "tcorpion_cache"
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+CACHE_VERSION = 1  # Bump whenever rendering changes, cached videos outlive restarts and deploys
+
+@functools.lru_cache(maxsize=None)
+def load_font(size):
+    """Load the first available monospace TrueType font at the given size (once per process)"""
+    for font_name in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(font_name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size)
+
+@functools.lru_cache(maxsize=4)
+def load_background_image(image_path, mtime):
+    """Decode the image and crop-fill it to the video size (cached until the file changes)"""
+    with Image.open(image_path) as img:
+        # Same framing as SVG's preserveAspectRatio="xMidYMid slice"
+        return ImageOps.fit(img.convert("RGB"), (VIDEO_WIDTH, VIDEO_HEIGHT))
+
+def _darken(img, opacity):
+    """Equivalent of a black layer with the given fill-opacity over the image"""
+    return img.point(lambda v: int(v * (1 - opacity)))
+
+def render_background(bg_image=None, overlay_opacity=0.7, banner_y=BANNER_Y, banner_height=BANNER_HEIGHT):
+    """Render the static background and banner once, returns an (H, W, 3) uint8 array"""
     
     # Create background
-    background = ""
     if bg_image and os.path.exists(bg_image):
-        # Convert image to base64 for proper embedding
-        img_data = image_to_base64(bg_image)
-        if img_data:
-            background += f'<image href="{img_data}" width="100%" height="100%" preserveAspectRatio="xMidYMid slice"/>'
-        else:
-            background += '<rect width="100%" height="100%" fill="#1a1a2e"/>'  # Dark fallback
-        background += f'<rect width="100%" height="100%" fill="black" fill-opacity="{overlay_opacity}"/>'
+        try:
+            img = load_background_image(bg_image, os.path.getmtime(bg_image))
+        except Exception:
+            img = Image.new("RGB", (VIDEO_WIDTH, VIDEO_HEIGHT), "#1a1a2e")  # Dark fallback
+        img = _darken(img, overlay_opacity)
     else:
-        background += '<rect width="100%" height="100%" fill="#0f0f23"/>'  # Dark background
-    
-    # Banner-style design elements
-    banner_height = 140  # Reduced height for sleeker look
-    banner_y = (VIDEO_HEIGHT - banner_height) // 2
+        img = Image.new("RGB", (VIDEO_WIDTH, VIDEO_HEIGHT), "#0f0f23")  # Dark background
     
     # Semi-transparent banner background for better text visibility
-    banner_bg = f'<rect x="0" y="{banner_y}" width="100%" height="{banner_height}" fill="black" fill-opacity="0.4" stroke="#00FF41" stroke-width="2"/>'
+    banner_box = (0, banner_y, VIDEO_WIDTH, banner_y + banner_height)
+    img.paste(_darken(img.crop(banner_box), 0.4), banner_box)
+    ImageDraw.Draw(img).rectangle(
+        (0, banner_y - 1, VIDEO_WIDTH - 1, banner_y + banner_height),
+        outline="#00FF41", width=2
+    )
     
-    # Calculate positioning for terminal-style left alignment within banner
-    left_margin = 150  # More space from left edge
-    text_y = VIDEO_HEIGHT // 2  # Center vertically
+    return np.asarray(img)
+
+def text_glow_masks(display_text, font, text_y=TEXT_Y):
+    """Crisp and blurred text masks cropped to the text's bounding box, plus their paste position
     
-    # Build visible text (only show characters that should be typed so far)
-    visible_text = text[:chars_visible]
+    Blurring only the box around the text instead of the whole canvas keeps the glow
+    cost proportional to the text size.
+    """
+    pad = GLOW_RADIUS * 3  # Room for the blur to fade out
+    left, top, right, bottom = font.getbbox(display_text, anchor="lm")
+    position = (LEFT_MARGIN + left - pad, text_y + top - pad)
+    text_mask = Image.new("L", (right - left + 2 * pad, bottom - top + 2 * pad), 0)
+    ImageDraw.Draw(text_mask).text((pad - left, pad - top), display_text, font=font, fill=255, anchor="lm")
+    return text_mask, text_mask.filter(ImageFilter.GaussianBlur(GLOW_RADIUS)), position
+
+def render_text_layer(banner_array, visible_text, cursor, color, font, deco_font=None):
+    """Draw the typed text (with glow) and banner decorations onto a copy of the banner rows
     
-    # Add cursor effect (blinking cursor after last typed character)
-    cursor = "█" if chars_visible < len(text) else ""  # Block cursor
+    ``banner_array`` is ``background[BANNER_ROWS]``, everything outside it is static.
+    """
+    img = Image.fromarray(banner_array)  # RGB arrays are copied, the cached background stays untouched
     display_text = visible_text + cursor
+    text_y = TEXT_Y - BANNER_Y
+    
+    # Glow: blur the text on its own alpha layer, then lay the crisp text on top
+    if display_text:
+        text_mask, glow_mask, position = text_glow_masks(display_text, font, text_y)
+        img.paste(color, position, glow_mask)
+        img.paste(color, position, text_mask)
     
     # Add some decorative elements for banner feel
-    decorative_elements = ""
-    if chars_visible > 0:  # Only show decorations after typing starts
+    if visible_text:  # Only show decorations after typing starts
+        deco_font = deco_font or font
+        draw = ImageDraw.Draw(img)
         # Left decoration
-        decorative_elements += f'<text x="60" y="{text_y}" font-family="Courier New, monospace" font-size="48px" fill="{text_color}" text-anchor="start" dominant-baseline="middle">►</text>'
+        draw.text((60, text_y), "►", font=deco_font, fill=color, anchor="lm")
         # Right decoration (only when text is complete)
-        if chars_visible >= len(text):
-            text_width_estimate = len(visible_text) * 43  # Rough estimate
-            right_x = left_margin + text_width_estimate + 50
-            decorative_elements += f'<text x="{right_x}" y="{text_y}" font-family="Courier New, monospace" font-size="48px" fill="{text_color}" text-anchor="start" dominant-baseline="middle">◄</text>'
-    
-    # Terminal-style positioning with banner aesthetics
-    svg = f"""<?xml version="1.0" encoding="UTF-8" standalone="no"?>
-<svg xmlns="http://www.w3.org/2000/svg" width="{VIDEO_WIDTH}" height="{VIDEO_HEIGHT}" viewBox="0 0 {VIDEO_WIDTH} {VIDEO_HEIGHT}">
-    <defs>
-        <filter id="glow">
-            <feGaussianBlur stdDeviation="3" result="coloredBlur"/>
-            <feMerge> 
-                <feMergeNode in="coloredBlur"/>
-                <feMergeNode in="SourceGraphic"/>
-            </feMerge>
-        </filter>
-    </defs>
-    {background}
-    {banner_bg}
-    {decorative_elements}
-    <text x="{left_margin}" y="{text_y}" 
-          font-family="Courier New, Consolas, Monaco, monospace" 
-          font-size="{FONT_SIZE}px" 
-          fill="{text_color}" 
-          text-anchor="start" 
-          dominant-baseline="middle"
-          font-weight="bold"
-          filter="url(#glow)">
-        {display_text}
-    </text>
-</svg>"""
-    
-    return svg
+        if not cursor:
+            right_x = LEFT_MARGIN + font.getlength(visible_text) + 50
+            draw.text((right_x, text_y), "◄", font=deco_font, fill=color, anchor="lm")
+    
+    return np.asarray(img)
+
+def typing_frame(text, chars_visible, text_color, background, font, deco_font=None):
+    """Render the banner rows of one typing frame on top of a pre-rendered background"""
+    # Add cursor effect (blinking cursor after last typed character)
+    cursor = "█" if chars_visible < len(text) else ""  # Block cursor
+    return render_text_layer(background[BANNER_ROWS], text[:chars_visible], cursor, text_color, font, deco_font)
 
-def typing_to_mp4(text, output_file="typing.mp4", fps=6, hold_end=30, bg_image=None, text_color="#00FF41", verbose=False):
-    """Create terminal-banner typing animation video"""
+def warm_up():
+    """Process pool initializer - load the fonts before the first frame needs them"""
+    load_font(FONT_SIZE)
+    load_font(DECORATION_FONT_SIZE)
+
+def resolve_background(bg_image, bg_mtime=None, verbose=False):
+    """Return ``(bg_image, bg_mtime)``, or ``(None, None)`` when the image doesn't exist
+    
+    Callers that already track the file's mtime pass it in and skip the stat.
+    """
+    if not bg_image or bg_mtime is not None:
+        return bg_image, bg_mtime
+    try:
+        return bg_image, os.path.getmtime(bg_image)
+    except OSError:
+        if verbose:
+            print(f"Warning: Background image '{bg_image}' not found!")
+        return None, None
+
+@functools.lru_cache(maxsize=4)
+def _frame_resources(bg_image, bg_mtime):
+    """Background array and fonts, built once per process and background version"""
+    return render_background(bg_image), load_font(FONT_SIZE), load_font(DECORATION_FONT_SIZE)
+
+def _render_one_frame(chars_visible, text, text_color, bg_image=None, bg_mtime=None, verbose=False):
+    """Render the banner rows of a single typing frame, module level so it can run in worker processes"""
+    try:
+        background, font, deco_font = _frame_resources(bg_image, bg_mtime)
+        return typing_frame(text, chars_visible, text_color, background, font, deco_font)
+    except Exception as e:
+        if verbose:
+            print(f"Error generating frame {chars_visible}: {e}")
+        return None
+
+def pad_filter(fps, pause_frames, hold_end):
+    """ffmpeg tpad filter that clones the first and last frames instead of re-encoding copies"""
+    start_duration = (pause_frames - 1) / fps
+    stop_duration = hold_end / fps
+    return (
+        f"tpad=start_mode=clone:start_duration={start_duration:g}"
+        f":stop_mode=clone:stop_duration={stop_duration:g}"
+    )
+
+def encoder_args(fps, pause_frames, hold_end):
+    """x264 output options shared by the imageio writer and the async ffmpeg pipe"""
+    return [
+        "-vf", pad_filter(fps, pause_frames, hold_end),
+        "-pix_fmt", "yuv420p",
+        "-preset", "ultrafast",  # Encode speed matters more than file size for the bot
+        "-crf", "23",  # Indistinguishable at Discord's display size
+        "-tune", "stillimage",
+        "-movflags", "+faststart",  # Playable before fully downloaded
+        "-threads", "0"
+    ]
+
+def typing_to_mp4(text, output_file="typing.mp4", fps=6, hold_end=30, bg_image=None, text_color="#00FF41", verbose=False, workers=None):
+    """Create terminal-banner typing animation video
+    
+    Typing frames are rendered across ``workers`` processes (defaults to the CPU count),
+    short texts or ``workers=1`` render serially in this process.
+    """
     
     if verbose:
         print(f"Creating animation for: '{text}'")
     
-    if bg_image and not os.path.exists(bg_image):
-        if verbose:
-            print(f"Warning: Background image '{bg_image}' not found!")
-        bg_image = None
+    # Static layers are rasterized once per process, only the text changes between frames
+    bg_image, bg_mtime = resolve_background(bg_image, verbose=verbose)
+    render = functools.partial(
+        _render_one_frame, text=text, text_color=text_color,
+        bg_image=bg_image, bg_mtime=bg_mtime, verbose=verbose
+    )
     
-    frames = []
+    if verbose:
+        print(f"Creating video: {output_file}")
     
     # Add a brief pause at the start (blank banner) - just 500ms
     pause_frames = max(1, int(fps * 0.5))  # 0.5 seconds = 500ms
-    for _ in range(pause_frames):
-        svg = typing_svg_frame(text, 0, text_color=text_color, bg_image=bg_image)
-        try:
-            png_bytes = cairosvg.svg2png(
-                bytestring=svg.encode("utf-8"), 
-                output_width=VIDEO_WIDTH,
-                output_height=VIDEO_HEIGHT,
-                dpi=96
-            )
-            img = Image.open(io.BytesIO(png_bytes)).convert("RGB")
-            frames.append(np.array(img))
-        except Exception as e:
-            if verbose:
-                print(f"Error generating initial frame: {e}")
-    
-    # Generate frames for typing animation
-    for i in range(1, len(text) + 1):
-        try:
-            svg = typing_svg_frame(text, i, text_color=text_color, bg_image=bg_image)
-            
-            # Convert SVG to PNG
-            png_bytes = cairosvg.svg2png(
-                bytestring=svg.encode("utf-8"), 
-                output_width=VIDEO_WIDTH,
-                output_height=VIDEO_HEIGHT,
-                dpi=96
-            )
-            
-            # Convert to PIL Image and then numpy array
-            img = Image.open(io.BytesIO(png_bytes)).convert("RGB")
-            frames.append(np.array(img))
-            
-            if verbose and i % 5 == 0:
-                print(f"Generated frame {i}/{len(text)}")
-            
-        except Exception as e:
-            if verbose:
-                print(f"Error generating frame {i}: {e}")
-            continue
     
-    if not frames:
-        raise Exception("No frames were generated successfully")
+    # Frames are streamed straight into the encoder instead of being collected in memory
+    writer = imageio.get_writer(
+        output_file, 
+        fps=fps, 
+        codec="libx264", 
+        quality=None,  # Rate control comes from -crf in encoder_args
+        macro_block_size=8,  # 1920x1080 is already aligned, keeps imageio from adding its own -vf scale
+        ffmpeg_params=encoder_args(fps, pause_frames, hold_end)
+    )
     
-    # Create final frame without cursor but with decorations
     try:
-        final_svg = typing_svg_frame(text, len(text), text_color=text_color, bg_image=bg_image)
-        # Remove cursor from final frame
-        final_svg = final_svg.replace("█", "")
+        frame_count = 0
+        # Rows outside the banner never change, each frame only overwrites BANNER_ROWS.
+        # append_data writes synchronously, so the buffer can be reused right away.
+        frame_buf = _frame_resources(bg_image, bg_mtime)[0].copy()
         
-        png_bytes = cairosvg.svg2png(
-            bytestring=final_svg.encode("utf-8"),
-            output_width=VIDEO_WIDTH,
-            output_height=VIDEO_HEIGHT,
-            dpi=96
-        )
-        final_frame = np.array(Image.open(io.BytesIO(png_bytes)).convert("RGB"))
+        # The blank frame is written once, ffmpeg clones it for the rest of the pause
+        blank_banner = render(0)
+        if blank_banner is not None:
+            frame_buf[BANNER_ROWS] = blank_banner
+            writer.append_data(frame_buf)
+            frame_count += pause_frames
+        
+        # Generate frames for typing animation - every frame is independent, ex.map keeps the order
+        workers = workers or os.cpu_count() or 1
+        positions = range(1, len(text) + 1)
+        if workers > 1 and len(text) >= PARALLEL_MIN_CHARS:
+            ex = ProcessPoolExecutor(max_workers=min(workers, len(text)))
+            typed_frames = ex.map(render, positions, chunksize=4)
+        else:
+            ex = None
+            typed_frames = map(render, positions)
+        
+        try:
+            for i, banner in enumerate(typed_frames, start=1):
+                if banner is None:
+                    continue
+                frame_buf[BANNER_ROWS] = banner
+                writer.append_data(frame_buf)
+                frame_count += 1
+                if verbose and i % 5 == 0:
+                    print(f"Generated frame {i}/{len(text)}")
+        finally:
+            if ex is not None:
+                ex.shutdown()
+        
+        if not frame_count:
+            raise Exception("No frames were generated successfully")
+        
+        # Hold final frame (the fully typed frame already has no cursor) - cloned by ffmpeg's tpad
+        frame_count += hold_end
         
-        # Hold final frame
-        for _ in range(hold_end):
-            frames.append(final_frame)
-            
     except Exception as e:
         if verbose:
-            print(f"Warning: Could not create final frame: {e}")
-        for _ in range(hold_end):
-            frames.append(frames[-1])
+            print(f"Error creating video: {e}")
+        raise
+    finally:
+        writer.close()
     
     if verbose:
-        print(f"Total frames: {len(frames)}")
-        print(f"Creating video: {output_file}")
+        print(f"Total frames: {frame_count}")
+        print(f"Video saved as: {output_file}")
+    
+    return output_file
+
+async def typing_to_mp4_async(text, output_file="typing.mp4", fps=6, hold_end=30, bg_image=None, text_color="#00FF41", verbose=False, executor=None, bg_mtime=None):
+    """Async variant of typing_to_mp4 for use inside an event loop
+    
+    Frames render in ``executor`` (the loop's default executor when None) and are piped
+    to an ffmpeg subprocess, so the loop stays responsive for the whole encode. A process
+    executor must not use the fork start method, its workers would hold ffmpeg's stdin open.
+    """
+    loop = asyncio.get_running_loop()
+    
+    bg_image, bg_mtime = resolve_background(bg_image, bg_mtime, verbose)
+    render = functools.partial(
+        _render_one_frame, text=text, text_color=text_color,
+        bg_image=bg_image, bg_mtime=bg_mtime, verbose=verbose
+    )
+    pause_frames = max(1, int(fps * 0.5))  # 0.5 seconds = 500ms
+    
+    proc = await asyncio.create_subprocess_exec(
+        imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-loglevel", "error",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{VIDEO_WIDTH}x{VIDEO_HEIGHT}",
+        "-r", str(fps), "-i", "pipe:0",
+        "-c:v", "libx264", *encoder_args(fps, pause_frames, hold_end),
+        output_file,
+        stdin=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
     
-    # Create video with better quality settings
+    in_flight = deque()
     try:
-        writer = imageio.get_writer(
-            output_file, 
-            fps=fps, 
-            codec="libx264", 
-            quality=9,  # Higher quality
-            ffmpeg_params=[
-                "-pix_fmt", "yuv420p",
-                "-preset", "slow",  # Better compression
-                "-crf", "18"  # High quality
-            ]
-        )
+        frames_written = 0
+        # Rows outside the banner never change, each frame only overwrites BANNER_ROWS.
+        # The pipe transport copies whatever it can't write immediately, so the buffer is reusable.
+        frame_buf = (await loop.run_in_executor(None, _frame_resources, bg_image, bg_mtime))[0].copy()
         
-        for i, frame in enumerate(frames):
-            writer.append_data(frame)
+        async def write_next():
+            nonlocal frames_written
+            banner = await in_flight.popleft()
+            if banner is not None:
+                frame_buf[BANNER_ROWS] = banner
+                proc.stdin.write(frame_buf.data.cast("B"))  # Flat view of the array, no tobytes() copy
+                await proc.stdin.drain()
+                frames_written += 1
         
-        writer.close()
-        if verbose:
-            print(f"Video saved as: {output_file}")
+        # Frame 0 is the blank banner, tpad holds it for the pause and the last one for the end
+        for i in range(len(text) + 1):
+            in_flight.append(loop.run_in_executor(executor, render, i))
+            if len(in_flight) >= MAX_FRAMES_IN_FLIGHT:
+                await write_next()
+        while in_flight:
+            await write_next()
         
-    except Exception as e:
-        if verbose:
-            print(f"Error creating video: {e}")
+        if not frames_written:
+            raise Exception("No frames were generated successfully")
+        
+        proc.stdin.close()  # EOF tells ffmpeg to flush, communicate() only closes stdin when given input
+        _, stderr = await proc.communicate()
+        if proc.returncode != 0:
+            raise Exception(f"ffmpeg failed: {stderr.decode(errors='replace').strip()}")
+        
+    except BaseException:
+        # Frames nobody will write, stop queued renders and don't leave exceptions unretrieved
+        for fut in in_flight:
+            if not fut.cancel() and not fut.cancelled():
+                fut.exception()
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
         raise
     
+    if verbose:
+        print(f"Video saved as: {output_file}")
+    
     return output_file
 
 def cleanup_temp_files(*file_paths):
@@ -225,9 +363,64 @@ def cleanup_temp_files(*file_paths):
         except Exception:
             pass  # Silently ignore cleanup errors
 
-def create_welcome_video(username, output_file="welcome.mp4", bg_image=None, cleanup=True, verbose=False):
+def welcome_color(username):
+    """Pick the text color from the username so the same user always gets the same video"""
+    return WELCOME_COLORS[zlib.crc32(username.encode("utf-8")) % len(WELCOME_COLORS)]
+
+def _cached_video_path(username, bg_image, color, bg_mtime=None):
+    """Cache entry for a welcome video, keyed on its inputs, encoder settings and CACHE_VERSION"""
+    bg_image, bg_mtime = resolve_background(bg_image, bg_mtime)
+    pause_frames = max(1, int(WELCOME_FPS * 0.5))
+    encoding = " ".join(encoder_args(WELCOME_FPS, pause_frames, WELCOME_HOLD_END))
+    key_source = f"{CACHE_VERSION}|{username}|{bg_image}|{bg_mtime}|{color}|{encoding}"
+    key = hashlib.blake2b(key_source.encode("utf-8")).hexdigest()[:16]
+    return CACHE_DIR / f"{key}.mp4"
+
+def _copy_from_cache(cached, output_file):
+    """Copy a cached video to output_file, returns False on a cache miss"""
+    try:
+        shutil.copyfile(cached, output_file)
+        cached.touch()  # Mark as recently used for prune_video_cache
+        return True
+    except OSError:
+        return False
+
+def _store_in_cache(video_path, cached):
+    """Save a freshly rendered video in the cache (best effort)"""
+    partial = None
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # Unique per call - stores of the same video from different threads can't share a partial
+        fd, partial = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        os.close(fd)
+        shutil.copyfile(video_path, partial)
+        os.replace(partial, cached)  # Atomic, readers never see a half-written entry
+    except OSError:
+        pass
+    finally:
+        if partial is not None:
+            Path(partial).unlink(missing_ok=True)
+
+def prune_video_cache(max_bytes=CACHE_MAX_BYTES):
+    """Delete the least recently used cached videos until the cache fits in max_bytes"""
+    if not CACHE_DIR.exists():
+        return
+    entries = []
+    for path in CACHE_DIR.iterdir():
+        try:
+            entries.append((path.stat(), path))
+        except OSError:
+            continue
+    total = 0
+    for stat, path in sorted(entries, key=lambda entry: entry[0].st_mtime, reverse=True):
+        total += stat.st_size
+        if total > max_bytes or path.suffix != ".mp4":
+            path.unlink(missing_ok=True)
+
+def create_welcome_video(username, output_file="welcome.mp4", bg_image=None, cleanup=True, verbose=False, workers=None):
     """
-    Main function for bot usage - creates welcome video and optionally cleans up
+    Main function for bot usage - creates welcome video and optionally cleans up.
+    Videos are cached in CACHE_DIR, so repeat calls for a user just copy the file.
     
     Args:
         username (str): Username to welcome
@@ -235,14 +428,18 @@ def create_welcome_video(username, output_file="welcome.mp4", bg_image=None, cle
         bg_image (str): Path to background image (optional)
         cleanup (bool): Whether to clean up temporary files
         verbose (bool): Whether to print progress messages
+        workers (int): Processes used to render frames (optional, defaults to CPU count)
     
     Returns:
         str: Path to created video file
     """
     text = f"Welcome {username}!"
     temp_files = []
-
-    color = ["#00FF41", "#009DFF", "#FF004C", "#FFFFFF", "#FFA200"]
+    
+    color = welcome_color(username)
+    cached = _cached_video_path(username, bg_image, color)
+    if _copy_from_cache(cached, output_file):
+        return output_file
     
     try:
         # Create the video
@@ -250,11 +447,13 @@ def create_welcome_video(username, output_file="welcome.mp4", bg_image=None, cle
             text=text,
             output_file=output_file,
             bg_image=bg_image,
-            fps=6,
-            hold_end=30,
-            text_color=color[random.randrange(len(color))],
-            verbose=verbose
+            fps=WELCOME_FPS,
+            hold_end=WELCOME_HOLD_END,
+            text_color=color,
+            verbose=verbose,
+            workers=workers
         )
+        _store_in_cache(video_path, cached)
         
         # Add any test files to cleanup list if they exist
         temp_files.extend(["test_banner_frame.png", "test_frame_start.png", "test_frame_middle.png", "test_frame_end.png"])
@@ -269,6 +468,43 @@ def create_welcome_video(username, output_file="welcome.mp4", bg_image=None, cle
             cleanup_temp_files(*temp_files)
         raise e
 
+async def create_welcome_video_async(username, output_file="welcome.mp4", bg_image=None, verbose=False, executor=None, bg_mtime=None):
+    """
+    Async version of create_welcome_video for the bot's event loop
+    
+    Args:
+        username (str): Username to welcome
+        output_file (str): Output video filename
+        bg_image (str): Path to background image (optional)
+        verbose (bool): Whether to print progress messages
+        executor (Executor): Where frames are rendered (optional, loop default)
+        bg_mtime (float): Known mtime of bg_image, skips the stat (optional)
+    
+    Returns:
+        str: Path to created video file
+    """
+    loop = asyncio.get_running_loop()
+    color = welcome_color(username)
+    
+    # Cache lookups and copies are blocking file I/O, keep them off the event loop
+    cached = await loop.run_in_executor(None, _cached_video_path, username, bg_image, color, bg_mtime)
+    if await loop.run_in_executor(None, _copy_from_cache, cached, output_file):
+        return output_file
+    
+    video_path = await typing_to_mp4_async(
+        text=f"Welcome {username}!",
+        output_file=output_file,
+        bg_image=bg_image,
+        fps=WELCOME_FPS,
+        hold_end=WELCOME_HOLD_END,
+        text_color=color,
+        verbose=verbose,
+        executor=executor,
+        bg_mtime=bg_mtime
+    )
+    await loop.run_in_executor(None, _store_in_cache, video_path, cached)
+    return video_path
+
 if __name__ == "__main__":
     # Use your background image - update this path!
     bg_path = "bg.png"  # Make sure this matches your actual image filename
@@ -297,7 +533,7 @@ if __name__ == "__main__":
         
     except Exception as e:
         print(f"Failed to create video: {e}")
-        print("Make sure you have: pip install cairosvg pillow imageio imageio-ffmpeg numpy")
+        print("Make sure you have: pip install pillow imageio imageio-ffmpeg numpy")
 
     # Example for bot usage (silent):
     print("\n--- Bot Usage Example ---")